@@ -1,4 +1,11 @@
-from flask import Flask, request, jsonify, abort
+import functools
+import hashlib
+import os
+import threading
+import time
+
+import orjson
+from flask import Flask, Response, request, abort
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST, CollectorRegistry, multiprocess
 from prometheus_client import make_wsgi_app
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
@@ -6,46 +13,94 @@ from werkzeug.exceptions import HTTPException
 
 app = Flask(__name__)
 
-# In-memory store
-items = []
+def ojsonify(obj, status=200):
+    # orjson serializes straight to bytes, several times faster than jsonify
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def get_json_body():
+    # orjson refuses some JSON the stdlib parser accepts (integers beyond
+    # 64 bits, very deep nesting) and silently turns NaN/Infinity into null;
+    # reject both up front so what is stored is exactly what gets served
+    data = request.get_json() or {}
+    try:
+        raw = orjson.dumps(data)
+    except orjson.JSONEncodeError:
+        abort(400)
+    if orjson.loads(raw) != data:
+        abort(400)
+    return raw
+
+def compute_etag(raw):
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
 
-# Metrics
+# In-memory store mapping item id -> (record, etag): the item's serialized
+# {'id', 'data'} record, built once per write so reads and list_items only
+# join bytes, and the ETag of its data for conditional GETs. Dicts preserve
+# insertion order, so listing still returns items in creation order.
+items = {}
+_next_id = 1
+# Bumped on every mutation; list_items reuses its serialized output until
+# the version changes. The version is only meaningful within this process,
+# so the list ETag also carries a per-process token.
+_items_version = 0
+_items_epoch = os.urandom(4).hex()
+_items_cache = (None, None)
+# Guards mutations of the store under threaded/greenlet workers
+_items_lock = threading.Lock()
+
+# Metrics. `code` is the status class ('2xx', '4xx', '5xx') rather than the
+# exact status, to keep the number of series per route small.
 HTTP_REQUESTS = Counter('http_requests_total', 'Total HTTP requests', ['method', 'route', 'code'])
-HTTP_DURATION = Histogram('http_request_duration_seconds', 'HTTP request duration', ['method', 'route', 'code'], buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 2, 5))
+# Buckets are dense below 100ms where CRUD requests land; +Inf catches
+# anything over a second, such as requests slowed with ?delay= under
+# DEBUG_SIM (the delay is part of the timed duration).
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'HTTP request duration', ['method', 'route'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, float('inf')))
 
 # Additional metrics for richer visualization
-HTTP_ERRORS = Counter('http_errors_total', 'Total HTTP error responses (>=500)', ['method', 'route', 'code'])
+HTTP_ERRORS = Counter('http_errors_total', 'Total HTTP error responses (>=500)', ['method', 'route'])
 HTTP_SLOW = Counter('http_slow_requests_total', 'Number of requests exceeding slow threshold (seconds)', ['method', 'route'])
-LAST_DURATION = Histogram('http_last_request_duration_seconds', 'Last request duration seconds', ['method', 'route'])
 
 # Threshold (seconds) above which a request is considered "slow"
 SLOW_THRESHOLD = 5.0
 
+# Honour the ?delay= / ?fail= simulation controls only when DEBUG_SIM=1
+DEBUG_SIM = os.environ.get('DEBUG_SIM') == '1'
+
+@functools.lru_cache(maxsize=256)
+def _metric_child(metric, *labelvalues):
+    # labels() validates and hashes the label values under a lock on every
+    # call; resolve each (metric, labels) child once and reuse it.
+    return metric.labels(*labelvalues)
+
 def with_metrics(route):
+    slow_threshold = SLOW_THRESHOLD
     def decorator(f):
-        def wrapped(*args, **kwargs):
-            import time
-            # support simple simulation controls via query params for testing/visualization
-            # ?delay=SECONDS to add artificial latency, ?fail=1 to force a 500
-            delay = request.args.get('delay')
-            if delay:
-                try:
-                    time.sleep(float(delay))
-                except Exception:
-                    pass
-            if request.args.get('fail'):
-                # simulate a server error
-                abort(500)
-
-            start = time.time()
+        @functools.wraps(f)
+        def wrapped(**kwargs):
+            # resolve the LocalProxy once; later accesses hit the Request directly
+            req = request._get_current_object()
+            start = time.perf_counter()
             status = 200
             try:
-                response = f(*args, **kwargs)
-                # response can be (body, status) or a Flask Response
-                if isinstance(response, tuple) and len(response) > 1 and isinstance(response[1], int):
-                    status = response[1]
-                elif hasattr(response, 'status_code'):
-                    status = response.status_code
+                # support simple simulation controls via query params for testing/visualization
+                # ?delay=SECONDS to add artificial latency, ?fail=1 to force a 500
+                # (under the gevent worker time.sleep is patched to yield, so a
+                # delayed request parks its greenlet instead of a whole worker).
+                # Both run inside the timed block so they show up in the metrics.
+                if DEBUG_SIM:
+                    delay = req.args.get('delay')
+                    if delay:
+                        try:
+                            time.sleep(float(delay))
+                        except Exception:
+                            pass
+                    if req.args.get('fail'):
+                        # simulate a server error
+                        abort(500)
+
+                # decorated views always return a Response object
+                response = f(**kwargs)
+                status = response.status_code
                 return response
             except Exception as e:
                 # If the exception is a Werkzeug HTTPException (abort(404), etc.)
@@ -57,18 +112,17 @@ def with_metrics(route):
                     status = 500
                 raise
             finally:
-                duration = time.time() - start
-                code = str(status)
+                duration = time.perf_counter() - start
+                code = f'{status // 100}xx'
                 # core metrics
-                HTTP_REQUESTS.labels(method=request.method, route=route, code=code).inc()
-                HTTP_DURATION.labels(method=request.method, route=route, code=code).observe(duration)
+                method = req.method
+                _metric_child(HTTP_REQUESTS, method, route, code).inc()
+                _metric_child(HTTP_DURATION, method, route).observe(duration)
                 # extra metrics
-                LAST_DURATION.labels(method=request.method, route=route).observe(duration)
-                if int(code) >= 500:
-                    HTTP_ERRORS.labels(method=request.method, route=route, code=code).inc()
-                if duration >= SLOW_THRESHOLD:
-                    HTTP_SLOW.labels(method=request.method, route=route).inc()
-        wrapped.__name__ = f.__name__
+                if status >= 500:
+                    _metric_child(HTTP_ERRORS, method, route).inc()
+                if duration >= slow_threshold:
+                    _metric_child(HTTP_SLOW, method, route).inc()
         return wrapped
     return decorator
 
@@ -89,7 +143,7 @@ def index():
                                 type: string
                                 example: Flask CRUD app with Prometheus metrics
         """
-        return jsonify({'message': 'Flask CRUD app with Prometheus metrics'})
+        return ojsonify({'message': 'Flask CRUD app with Prometheus metrics'})
 
 @app.route('/items', methods=['GET'])
 @with_metrics('/items')
@@ -111,8 +165,22 @@ def list_items():
                                     type: integer
                                 data:
                                     type: object
+                304:
+                    description: Not modified (If-None-Match matches the list's ETag)
         """
-        return jsonify(items)
+        global _items_cache
+        version = _items_version
+        etag = f'{_items_epoch}-{version}'
+        if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+        else:
+                cached_version, buf = _items_cache
+                if cached_version != version or buf is None:
+                        buf = b'[' + b','.join(record for record, _ in items.values()) + b']'
+                        _items_cache = (version, buf)
+                response = Response(buf, mimetype='application/json')
+        response.set_etag(etag)
+        return response
 
 @app.route('/items', methods=['POST'])
 @with_metrics('/items')
@@ -140,11 +208,21 @@ def create_item():
                                 type: integer
                             data:
                                 type: object
+                400:
+                    description: Body cannot be serialized
         """
-        data = request.get_json() or {}
-        item = {'id': len(items) + 1, 'data': data}
-        items.append(item)
-        return jsonify(item), 201
+        global _next_id, _items_version
+        raw = get_json_body()
+        etag = compute_etag(raw)
+        with _items_lock:
+                iid = _next_id
+                _next_id += 1
+                record = b'{"id":%d,"data":%s}' % (iid, raw)
+                items[iid] = (record, etag)
+                _items_version += 1
+        response = Response(record, status=201, mimetype='application/json')
+        response.set_etag(etag)
+        return response
 
 @app.route('/items/<int:item_id>', methods=['GET'])
 @with_metrics('/items/<id>')
@@ -169,13 +247,21 @@ def get_item(item_id):
                                 type: integer
                             data:
                                 type: object
+                304:
+                    description: Not modified (If-None-Match matches the item's ETag)
                 404:
                     description: Not found
         """
-        for it in items:
-                if it['id'] == item_id:
-                        return jsonify(it)
-        abort(404)
+        entry = items.get(item_id)
+        if entry is None:
+                abort(404)
+        record, etag = entry
+        if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+        else:
+                response = Response(record, mimetype='application/json')
+        response.set_etag(etag)
+        return response
 
 @app.route('/items/<int:item_id>', methods=['PUT'])
 @with_metrics('/items/<id>')
@@ -198,15 +284,25 @@ def update_item(item_id):
             responses:
                 200:
                     description: Updated item
+                400:
+                    description: Body cannot be serialized
                 404:
                     description: Not found
         """
-        data = request.get_json() or {}
-        for it in items:
-                if it['id'] == item_id:
-                        it['data'] = data
-                        return jsonify(it)
-        abort(404)
+        global _items_version
+        raw = get_json_body()
+        etag = compute_etag(raw)
+        record = b'{"id":%d,"data":%s}' % (item_id, raw)
+        with _items_lock:
+                found = item_id in items
+                if found:
+                        items[item_id] = (record, etag)
+                        _items_version += 1
+        if not found:
+                abort(404)
+        response = Response(record, mimetype='application/json')
+        response.set_etag(etag)
+        return response
 
 @app.route('/items/<int:item_id>', methods=['DELETE'])
 @with_metrics('/items/<id>')
@@ -227,16 +323,28 @@ def delete_item(item_id):
                 404:
                     description: Not found
         """
-        global items
-        for it in items:
-                if it['id'] == item_id:
-                        items = [x for x in items if x['id'] != item_id]
-                        return '', 204
-        abort(404)
-
-# Expose metrics at /metrics using WSGI app
-metrics_app = make_wsgi_app()
+        global _items_version
+        with _items_lock:
+                removed = items.pop(item_id, None)
+                if removed is not None:
+                        _items_version += 1
+        if removed is None:
+                abort(404)
+        return Response(status=204)
+
+# Expose metrics at /metrics using WSGI app. Under gunicorn each worker is a
+# separate process, so aggregate all workers' metric files when
+# PROMETHEUS_MULTIPROC_DIR is set; otherwise use the default registry.
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    def metrics_app(environ, start_response):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE_LATEST)])
+        return [data]
+else:
+    metrics_app = make_wsgi_app()
+
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {'/metrics': metrics_app})
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=3000)
+# Serve with: gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,39 @@
+# Gunicorn settings for the Flask CRUD app: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+bind = '0.0.0.0:3000'
+
+# The GIL limits each process to one core, so scale with processes and keep
+# concurrency inside a worker cooperative (gevent) rather than thread-based.
+# GUNICORN_WORKERS overrides the default when the pod has a tight CPU limit.
+workers = int(os.environ.get('GUNICORN_WORKERS', 2 * multiprocessing.cpu_count() + 1))
+worker_class = 'gevent'
+worker_connections = 2000
+
+# Prometheus scrapes /metrics every few seconds; keep those connections open
+# rather than paying a TCP handshake per scrape.
+keepalive = 75
+backlog = 2048
+graceful_timeout = 30
+
+# Fork before importing the app so every worker owns its metric files
+# (see PROMETHEUS_MULTIPROC_DIR) instead of sharing the master's registry.
+preload_app = False
+
+
+def on_starting(server):
+    # Start from an empty metrics directory so counters left behind by a
+    # previous run are not summed into the new one.
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)